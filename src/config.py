@@ -9,38 +9,74 @@ Unless required by applicable law or agreed to in writing, software distributed
 an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the
 specific language governing permissions and limitations under the License.
 """
+import functools
 import os
+from dataclasses import dataclass, field
 from enum import Enum
 
+_TRUE_VALUES = frozenset({"true", "1", "yes", "on", "y", "t"})
+
 
 class ExporterType(Enum):
     GRPC = "grpc"
     HTTP = "http"
 
 
+@dataclass(frozen=True, slots=True)
 class Config:
-    def __init__(self):
-        self.debug = self._get_env_bool("DEBUG", False)
-        self.token = os.getenv("TOKEN", "todo")
-        self.service_name = os.getenv("SERVICE_NAME", "helloworld")
-        self.otlp_endpoint = os.getenv("OTLP_ENDPOINT", "http://localhost:4317")
-        self.otlp_exporter_type = ExporterType(os.getenv("OTLP_EXPORTER_TYPE", "grpc").lower())
-        self.enable_logs = self._get_env_bool("ENABLE_LOGS", self.debug)
-        self.enable_traces = self._get_env_bool("ENABLE_TRACES", self.debug)
-        self.enable_metrics = self._get_env_bool("ENABLE_METRICS", self.debug)
-        self.enable_profiling = self._get_env_bool("ENABLE_PROFILING", self.debug)
-        self.enable_memory_profiling = self._get_env_bool("ENABLE_MEMORY_PROFILING", True)
-        self.profiling_endpoint = os.getenv("PROFILING_ENDPOINT", "http://localhost:4040")
-        self.http_scheme = "http"
-        self.http_address = "0.0.0.0"
-        self.http_port = 8080
+    debug: bool
+    token: str = field(repr=False)
+    service_name: str
+    otlp_endpoint: str
+    otlp_exporter_type: ExporterType
+    enable_logs: bool
+    enable_traces: bool
+    enable_metrics: bool
+    enable_profiling: bool
+    enable_memory_profiling: bool
+    profiling_endpoint: str
+    trace_sample_ratio: float
+    flat_spans: bool
+    cpu_bound_tasks: bool
+    http_scheme: str = "http"
+    http_address: str = "0.0.0.0"
+    http_port: int = 8080
+
+    @classmethod
+    def from_env(cls) -> "Config":
+        debug = cls._get_env_bool("DEBUG", False)
+        return cls(
+            debug=debug,
+            token=os.getenv("TOKEN", "todo"),
+            service_name=os.getenv("SERVICE_NAME", "helloworld"),
+            otlp_endpoint=os.getenv("OTLP_ENDPOINT", "http://localhost:4317"),
+            otlp_exporter_type=ExporterType(os.getenv("OTLP_EXPORTER_TYPE", "grpc").lower()),
+            enable_logs=cls._get_env_bool("ENABLE_LOGS", debug),
+            enable_traces=cls._get_env_bool("ENABLE_TRACES", debug),
+            enable_metrics=cls._get_env_bool("ENABLE_METRICS", debug),
+            enable_profiling=cls._get_env_bool("ENABLE_PROFILING", debug),
+            enable_memory_profiling=cls._get_env_bool("ENABLE_MEMORY_PROFILING", True),
+            profiling_endpoint=os.getenv("PROFILING_ENDPOINT", "http://localhost:4040"),
+            trace_sample_ratio=float(os.getenv("TRACE_SAMPLE_RATIO", "1.0")),
+            flat_spans=cls._get_env_bool("FLAT_SPANS", False),
+            # 模拟 CPU 密集型任务会占满一个核，需显式开启，便于在 CPU profile 中观察
+            cpu_bound_tasks=cls._get_env_bool("CPU_BOUND_TASKS", False),
+        )
 
     @staticmethod
     def _get_env_bool(key: str, default: bool) -> bool:
         value = os.getenv(key)
-        if value is None:
-            return default
-        return value.lower() in ("true", "1", "yes")
+        return default if value is None else value.lower() in _TRUE_VALUES
+
+
+@functools.lru_cache(maxsize=1)
+def get_config() -> Config:
+    """Read environment variables on first use only"""
+    return Config.from_env()
 
 
-config = Config()
+def __getattr__(name: str):
+    # 兼容 `from config import config`，首次访问时才解析环境变量
+    if name == "config":
+        return get_config()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -10,11 +10,13 @@ an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express o
 specific language governing permissions and limitations under the License.
 """
 import logging
+import signal
 import sys
-import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import List
 
-from config import config
+from config import get_config
 from services.base import Service
 from services.otlp import OtlpService
 from services.profiling import DatadogProfilingService as ProfilingService
@@ -25,7 +27,17 @@ logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(mes
 logger = logging.getLogger(__name__)
 
 
+def stop_services(services: List[Service]):
+    for service in services:
+        try:
+            service.stop()
+            logger.info("[%s] service stopped", service.name)
+        except Exception as e:
+            logger.error("[%s] failed to stop: %s", service.name, e)
+
+
 def main():
+    config = get_config()
     services: List[Service] = [
         OtlpService(config),
         ProfilingService(config),
@@ -33,29 +45,43 @@ def main():
         QuerierService(config),
     ]
 
-    for service in services:
-        try:
-            service.start()
-            logger.info("[%s] service started", service)
-        except Exception as e:
-            logger.error("[%s] failed to start: %s", service, e)
-            sys.exit(1)
+    started: List[Service] = []
+    failed = False
+    with ThreadPoolExecutor(max_workers=len(services)) as executor:
+        futures = {executor.submit(service.start): service for service in services}
+        for future in as_completed(futures):
+            service = futures[future]
+            try:
+                future.result()
+                started.append(service)
+                logger.info("[%s] service started", service.name)
+            except Exception as e:
+                logger.error("[%s] failed to start: %s", service.name, e)
+                failed = True
+
+    if failed:
+        # 停止已启动的服务（如 querier 的非守护线程），否则进程无法退出
+        stop_services(started)
+        sys.exit(1)
 
     logger.info("[main] 🚀")
     logger.info("Press CTRL+C to quit")
 
-    try:
-        while True:
-            time.sleep(0.1)
-    except KeyboardInterrupt:
-        pass
+    # 阻塞直到收到 SIGINT / SIGTERM，期间主线程不会被周期性唤醒
+    shutdown_event = threading.Event()
 
-    for service in services:
-        try:
-            service.stop()
-            logger.info("[%s] service stopped", service)
-        except Exception as e:
-            logger.error("[%s] failed to stop: %s", service, e)
+    def _handle_signal(signum, frame):
+        shutdown_event.set()
+
+    signal.signal(signal.SIGINT, _handle_signal)
+    signal.signal(signal.SIGTERM, _handle_signal)
+    shutdown_event.wait()
+
+    # 恢复默认处理，停止服务过程中再次 CTRL+C / SIGTERM 仍可强制退出
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    stop_services(services)
 
     logger.info("[main] 👋")
 
@@ -13,6 +13,8 @@ from abc import ABC, abstractmethod
 
 
 class Service(ABC):
+    name: str
+
     @abstractmethod
     def start(self):
         raise NotImplementedError
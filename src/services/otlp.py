@@ -9,6 +9,7 @@ Unless required by applicable law or agreed to in writing, software distributed
 an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the
 specific language governing permissions and limitations under the License.
 """
+import functools
 import logging
 import platform
 import socket
@@ -30,6 +31,7 @@ from opentelemetry.sdk.metrics.view import ExplicitBucketHistogramAggregation, V
 from opentelemetry.sdk.resources import ProcessResourceDetector, Resource, ResourceDetector, get_aggregated_resources
 from opentelemetry.sdk.trace import TracerProvider
 from opentelemetry.sdk.trace.export import BatchSpanProcessor
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
 from opentelemetry.semconv.resource import ResourceAttributes
 from pyroscope.otel import PyroscopeSpanProcessor
 from typing_extensions import assert_never
@@ -42,6 +44,44 @@ try:
 except ImportError:
     OsResourceDetector: Optional[Type[ResourceDetector]] = None
 
+# 进程生命周期内不会变化，仅在导入时获取一次
+_OS_TYPE = platform.system().lower()
+_HOST_NAME = socket.gethostname()
+
+# 与 Collector 同机部署时，可使用 unix:///path/to/otel.sock
+# 通过 Unix Domain Socket 上报（仅 gRPC 支持）
+UDS_SCHEME = "unix:"
+
+# 加大批处理队列以吸收突发流量，减少丢弃与导出次数
+BATCH_PROCESSOR_OPTIONS = {
+    "max_queue_size": 8192,
+    "max_export_batch_size": 1024,
+    "schedule_delay_millis": 2000,
+    "export_timeout_millis": 10000,
+}
+
+
+@functools.lru_cache(maxsize=4)
+def _build_resource(token: str, service_name: str) -> Resource:
+    """Build aggregated resource, detectors only run once per (token, service_name)"""
+    detectors = [ProcessResourceDetector()]
+    if OsResourceDetector is not None:
+        detectors.append(OsResourceDetector())
+
+    # create 提供了部分 SDK 默认属性
+    initial_resource = Resource.create(
+        {
+            # ❗❗【非常重要】请传入应用 Token
+            "bk.data.token": token,
+            # ❗❗【非常重要】应用服务唯一标识
+            ResourceAttributes.SERVICE_NAME: service_name,
+            ResourceAttributes.OS_TYPE: _OS_TYPE,
+            ResourceAttributes.HOST_NAME: _HOST_NAME,
+        }
+    )
+
+    return get_aggregated_resources(detectors, initial_resource)
+
 
 @dataclass
 class OtlpConfig:
@@ -53,9 +93,12 @@ class OtlpConfig:
     enable_metrics: bool
     enable_logs: bool
     enable_profiling: bool
+    trace_sample_ratio: float = 1.0
 
 
 class OtlpService(Service):
+    name = "otlp"
+
     def __init__(self, config: Config):
         self.config = OtlpConfig(
             token=config.token,
@@ -66,12 +109,29 @@ class OtlpService(Service):
             enable_metrics=config.enable_metrics,
             enable_logs=config.enable_logs,
             enable_profiling=config.enable_profiling,
+            trace_sample_ratio=config.trace_sample_ratio,
         )
         self.tracer_provider: Optional[TracerProvider] = None
         self.meter_provider: Optional[MeterProvider] = None
         self.logger_provider: Optional[LoggerProvider] = None
 
+        # exporter 类型在进程生命周期内不变，初始化时即绑定对应的构造函数
+        endpoint = self.config.endpoint
+        if self.config.exporter_type == ExporterType.GRPC:
+            self._make_span_exporter = functools.partial(GRPCSpanExporter, endpoint=endpoint, insecure=True)
+            self._make_metric_exporter = functools.partial(GRPCMetricExporter, endpoint=endpoint, insecure=True)
+            self._make_log_exporter = functools.partial(GRPCLogExporter, endpoint=endpoint, insecure=True)
+        elif self.config.exporter_type == ExporterType.HTTP:
+            self._make_span_exporter = functools.partial(HTTPSpanExporter, endpoint=f"{endpoint}/v1/traces")
+            self._make_metric_exporter = functools.partial(HTTPMetricExporter, endpoint=f"{endpoint}/v1/metrics")
+            self._make_log_exporter = functools.partial(HTTPLogExporter, endpoint=f"{endpoint}/v1/logs")
+        else:
+            assert_never(self.config.exporter_type)
+
     def start(self):
+        if self.config.endpoint.startswith(UDS_SCHEME) and self.config.exporter_type != ExporterType.GRPC:
+            raise ValueError(f"endpoint {self.config.endpoint} requires exporter type {ExporterType.GRPC.value}")
+
         resource = self._create_resource()
 
         if self.config.enable_traces:
@@ -82,6 +142,10 @@ class OtlpService(Service):
 
         if self.config.enable_logs:
             self._setup_logs(resource)
+        else:
+            # 未开启日志上报时，info 日志在 isEnabledFor 阶段即被过滤，不再构造 LogRecord；
+            # 错误日志仍会输出
+            logging.getLogger("otel").setLevel(logging.WARNING)
 
     def stop(self):
         if self.tracer_provider:
@@ -94,43 +158,21 @@ class OtlpService(Service):
             self.logger_provider.shutdown()
 
     def _create_resource(self) -> Resource:
-        detectors = [ProcessResourceDetector()]
-        if OsResourceDetector is not None:
-            detectors.append(OsResourceDetector())
-  
-        # create 提供了部分 SDK 默认属性
-        initial_resource = Resource.create(
-            {
-                # ❗❗【非常重要】请传入应用 Token
-                "bk.data.token": self.config.token,
-                # ❗❗【非常重要】应用服务唯一标识
-                ResourceAttributes.SERVICE_NAME: self.config.service_name,
-                ResourceAttributes.OS_TYPE: platform.system().lower(),
-                ResourceAttributes.HOST_NAME: socket.gethostname(),
-            }
-        )
-
-        return get_aggregated_resources(detectors, initial_resource)
+        return _build_resource(self.config.token, self.config.service_name)
 
     def _setup_traces(self, resource: Resource):
-        otlp_exporter = self._setup_trace_exporter()
-        span_processor = BatchSpanProcessor(otlp_exporter)
-        self.tracer_provider = TracerProvider(resource=resource)
+        otlp_exporter = self._make_span_exporter()
+        span_processor = BatchSpanProcessor(otlp_exporter, **BATCH_PROCESSOR_OPTIONS)
+        # 根 Span 按比例采样，子 Span 跟随父 Span 的采样决策
+        sampler = ParentBased(TraceIdRatioBased(self.config.trace_sample_ratio))
+        self.tracer_provider = TracerProvider(resource=resource, sampler=sampler)
         self.tracer_provider.add_span_processor(span_processor)
         if self.config.enable_profiling:
             self.tracer_provider.add_span_processor(PyroscopeSpanProcessor())
         trace.set_tracer_provider(self.tracer_provider)
 
-    def _setup_trace_exporter(self):
-        if self.config.exporter_type == ExporterType.GRPC:
-            return GRPCSpanExporter(endpoint=self.config.endpoint, insecure=True)
-        elif self.config.exporter_type == ExporterType.HTTP:
-            return HTTPSpanExporter(endpoint=f"{self.config.endpoint}/v1/traces")
-        else:
-            assert_never(self.config.exporter_type)
-
     def _setup_metrics(self, resource: Resource):
-        otlp_exporter = self._setup_metric_exporter()
+        otlp_exporter = self._make_metric_exporter()
         reader = PeriodicExportingMetricReader(otlp_exporter)
         histogram_view = View(
             instrument_type=Histogram,
@@ -142,28 +184,15 @@ class OtlpService(Service):
         self.meter_provider = MeterProvider(resource=resource, metric_readers=[reader], views=[histogram_view])
         metrics.set_meter_provider(self.meter_provider)
 
-    def _setup_metric_exporter(self):
-        if self.config.exporter_type == ExporterType.GRPC:
-            return GRPCMetricExporter(endpoint=self.config.endpoint, insecure=True)
-        elif self.config.exporter_type == ExporterType.HTTP:
-            return HTTPMetricExporter(endpoint=f"{self.config.endpoint}/v1/metrics")
-        else:
-            assert_never(self.config.exporter_type)
-
     def _setup_logs(self, resource: Resource):
-        otlp_exporter = self._setup_log_exporter()
+        otlp_exporter = self._make_log_exporter()
         self.logger_provider = LoggerProvider(resource=resource)
-        self.logger_provider.add_log_record_processor(BatchLogRecordProcessor(otlp_exporter))
+        self.logger_provider.add_log_record_processor(BatchLogRecordProcessor(otlp_exporter, **BATCH_PROCESSOR_OPTIONS))
         handler = LoggingHandler(level=logging.NOTSET, logger_provider=self.logger_provider)
-        logging.getLogger("otel").addHandler(handler)
-
-    def _setup_log_exporter(self):
-        if self.config.exporter_type == ExporterType.GRPC:
-            return GRPCLogExporter(endpoint=self.config.endpoint, insecure=True)
-        elif self.config.exporter_type == ExporterType.HTTP:
-            return HTTPLogExporter(endpoint=f"{self.config.endpoint}/v1/logs")
-        else:
-            assert_never(self.config.exporter_type)
+        otel_logger = logging.getLogger("otel")
+        otel_logger.addHandler(handler)
+        # otel 日志仅通过 OTLP 上报，避免再传播到 root logger 重复输出
+        otel_logger.propagate = False
 
     def __str__(self):
-        return "otlp"
+        return self.name
@@ -9,21 +9,29 @@ Unless required by applicable law or agreed to in writing, software distributed
 an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the
 specific language governing permissions and limitations under the License.
 """
+import atexit
 import binascii
+import collections
 import gzip
+import http.client as http_client
 import json
 import logging
 import os
+import threading
 import typing
 import urllib.parse
+import weakref
 
-import six
 import tenacity
 from ddtrace.internal import agent
 from ddtrace.profiling import exporter
 from ddtrace.profiling.exporter.http import UploadFailed
 from ddtrace.profiling.exporter.pprof import PprofExporter  # noqa
-from six.moves import http_client
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 SAMPLE_TYPE_CONFIG = {
     "cpu-time": {
@@ -66,10 +74,33 @@ SAMPLE_TYPE_CONFIG = {
     },
 }
 
-SAMPLE_TYPE_CONFIG_JSON = json.dumps(SAMPLE_TYPE_CONFIG).encode()
+if orjson is not None:
+    SAMPLE_TYPE_CONFIG_JSON = orjson.dumps(SAMPLE_TYPE_CONFIG)
+else:
+    SAMPLE_TYPE_CONFIG_JSON = json.dumps(SAMPLE_TYPE_CONFIG).encode()
+
+_FIELD_HEADER_TMPL = (
+    b'Content-Disposition: form-data; name="%s"; filename="%s"\r\nContent-Type: application/octet-stream\r\n\r\n'
+)
+# 上报字段固定，预先生成对应的 multipart 头部
+_FIELD_HEADERS = {
+    field_name: _FIELD_HEADER_TMPL % (field_name, field_name) for field_name in (b"profile", b"sample_type_config")
+}
 
 logger = logging.getLogger(__name__)
 
+# 进程退出时补传尚未上报的 profile；弱引用，不延长 exporter 的生命周期
+# PprofExporter 是开启了 eq 的 attrs 类，__hash__ 为 None，无法放入 WeakSet
+_EXPORTER_REFS: typing.List["weakref.ReferenceType[PyroscopePprofHTTPExporter]"] = []
+
+
+@atexit.register
+def _flush_exporters():
+    for ref in _EXPORTER_REFS:
+        exporter_ = ref()
+        if exporter_ is not None:
+            exporter_.flush()
+
 
 class PyroscopePprofHTTPExporter(PprofExporter):
     """Send profiles via pprof format to pyroscope server"""
@@ -81,6 +112,8 @@ class PyroscopePprofHTTPExporter(PprofExporter):
         endpoint: str,
         max_retry_delay: int = 3,
         enable_code_provenance: bool = False,
+        max_pending: int = 10,
+        compress_level: int = 1,
     ):
         self.service_name = service_name
         self.token = token
@@ -88,6 +121,24 @@ class PyroscopePprofHTTPExporter(PprofExporter):
         self.max_retry_delay = max_retry_delay
         # useless in pyroscope now
         self.enable_code_provenance = enable_code_provenance
+        # pyroscope 只识别 gzip 压缩的 pprof，level 1 在压缩率与 CPU 开销间取得平衡
+        self.compress_level = compress_level
+
+        # pyroscope ignores content-type if format=pprof is provided
+        # which will cause Parser.Parse() failed
+        # https://github.com/pyroscope-io/pyroscope/blob/c068c7c0db1550b85031d7df0b56c84ce63036f6/pkg/server/ingest.go#L163
+        # name 与 spyName 在整个生命周期内不变，只需在上报时填充 from/until
+        self._url_template = (
+            f"{self.endpoint}?name={urllib.parse.quote_plus(self.service_name)}&spyName=ddtrace&from={{f}}&until={{u}}"
+        )
+
+        # 待上报的 (pprof_bytes, start_time_ns, end_time_ns)，由后台线程上报，不阻塞 profiler 线程
+        # 上报持续失败导致积压时丢弃最旧的数据
+        self._pending: typing.Deque[typing.Tuple[bytes, int, int]] = collections.deque(maxlen=max_pending)
+        self._pending_lock = threading.Lock()
+        self._uploading = False
+        self._upload_thread: typing.Optional[threading.Thread] = None
+        _EXPORTER_REFS.append(weakref.ref(self))
 
         self._retry_upload = tenacity.Retrying(
             # Retry after 1s, 2s, 4s, 8s with some randomness
@@ -111,24 +162,57 @@ class PyroscopePprofHTTPExporter(PprofExporter):
         @param start_time_ns: The start time of recording.
         @param end_time_ns: The end time of recording.
         """
+        # PprofExporter.export 只构建 protobuf 消息而不序列化，这里是唯一一次序列化；
+        # 重试只作用于 _upload_once，会复用已压缩好的数据
         profile, libs = super().export(events, start_time_ns, end_time_ns)
-        pprof = six.BytesIO()
-        with gzip.GzipFile(fileobj=pprof, mode="wb") as gz:
-            gz.write(profile.SerializeToString())
+        # 一次性压缩，避免 BytesIO + GzipFile 的多次拷贝
+        pprof_bytes = gzip.compress(profile.SerializeToString(), compresslevel=self.compress_level)
+
+        with self._pending_lock:
+            self._pending.append((pprof_bytes, start_time_ns, end_time_ns))
+            if not self._uploading:
+                self._uploading = True
+                self._upload_thread = threading.Thread(
+                    target=self._upload_pending, name="pyroscope-upload", daemon=True
+                )
+                self._upload_thread.start()
+
+        return profile, libs
+
+    def flush(self):
+        """Wait for the in-flight upload, then upload all pending profiles in the calling thread"""
+        # 后台线程可能已取走最后一个 profile，
+        # 退出时守护线程会被直接终止，需等待其上报完成
+        self._join_upload_thread()
+        self._upload_pending()
+        self._join_upload_thread()
+
+    def _join_upload_thread(self):
+        thread = self._upload_thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(self.max_retry_delay)
+
+    def _upload_pending(self):
+        """Upload pending profiles one by one until the queue is empty"""
+        while True:
+            with self._pending_lock:
+                if not self._pending:
+                    self._uploading = False
+                    return
+                pprof_bytes, start_time_ns, end_time_ns = self._pending.popleft()
+
+            try:
+                self._upload_profile(pprof_bytes, start_time_ns, end_time_ns)
+            except Exception as e:
+                logger.error("[ProfileExporter] failed to upload profile: %s", e)
+
+    def _upload_profile(self, pprof_bytes: bytes, start_time_ns: int, end_time_ns: int):
+        """Upload one profile window, pyroscope ingests exactly one profile per request"""
         data = {
-            b"profile": pprof.getvalue(),
+            b"profile": pprof_bytes,
             b"sample_type_config": SAMPLE_TYPE_CONFIG_JSON,
         }
-
-        # pyroscope ignores content-type if format=pprof is provided
-        # which will cause Parser.Parse() failed
-        # https://github.com/pyroscope-io/pyroscope/blob/c068c7c0db1550b85031d7df0b56c84ce63036f6/pkg/server/ingest.go#L163
-        params = {
-            "name": self.service_name,
-            "spyName": "ddtrace",
-            "from": start_time_ns,
-            "until": end_time_ns,
-        }
+        url = self._assemble_url(start_time_ns, end_time_ns)
         content_type, body = self._encode_multipart_formdata(data=data)
 
         headers = {
@@ -136,40 +220,40 @@ class PyroscopePprofHTTPExporter(PprofExporter):
             "Authorization": f"Bearer {self.token}",
         }
 
-        self._retry_upload(self._upload_once, body, headers, params)
-
-        return profile, libs
+        self._retry_upload(self._upload_once, body, headers, url)
 
     @staticmethod
     def _encode_multipart_formdata(data) -> typing.Tuple[bytes, bytes]:
         boundary = binascii.hexlify(os.urandom(16))
 
         # The body that is generated is very sensitive and must perfectly match what the server expects.
-        body = (
-            b"".join(
-                (
-                    b'--%s\r\nContent-Disposition: form-data; name="%s"; filename="%s"\r\n'
-                    % (boundary, field_name, field_name)
-                )
-                + b"Content-Type: application/octet-stream\r\n\r\n"
-                + field_data
-                + b"\r\n"
-                for field_name, field_data in data.items()
-            )
-            + b"--%s--" % boundary
-        )
+        parts = []
+        push = parts.append
+        for field_name, field_data in data.items():
+            header = _FIELD_HEADERS.get(field_name)
+            if header is None:
+                header = _FIELD_HEADER_TMPL % (field_name, field_name)
+            push(b"--")
+            push(boundary)
+            push(b"\r\n")
+            push(header)
+            push(field_data)
+            push(b"\r\n")
+        push(b"--")
+        push(boundary)
+        push(b"--")
+        body = b"".join(parts)
 
         content_type = b"multipart/form-data; boundary=%s" % boundary
 
         return content_type, body
 
-    def _assemble_url(self, params: dict) -> str:
-        """Assemble url with path and params"""
-        return f"{self.endpoint}?{urllib.parse.urlencode(params)}"
+    def _assemble_url(self, start_time_ns: int, end_time_ns: int) -> str:
+        """Assemble url with precomputed path and params"""
+        return self._url_template.format(f=start_time_ns, u=end_time_ns)
 
-    def _upload_once(self, body, headers: dict, params: dict):
+    def _upload_once(self, body, headers: dict, url: str):
         """Upload profile to target"""
-        url = self._assemble_url(params)
         client = agent.get_connection(self.endpoint)
 
         client.request("POST", url, body=body, headers=headers)
@@ -12,10 +12,8 @@ specific language governing permissions and limitations under the License.
 from dataclasses import dataclass
 
 import pyroscope
-from ddtrace.profiling.profiler import Profiler
 
 from config import Config
-from .patch import patch_ddtrace_to_pyroscope
 
 
 @dataclass
@@ -28,6 +26,8 @@ class ProfilingConfig:
 
 
 class BaseProfilingService:
+    name = "profiling"
+
     def __init__(self, config: Config):
         self.config = ProfilingConfig(
             # ❗❗【非常重要】请传入应用 Token
@@ -46,7 +46,7 @@ class BaseProfilingService:
         pass
 
     def __str__(self):
-        return "profiling"
+        return self.name
 
 
 class PyroscopeProfilingService(BaseProfilingService):
@@ -71,6 +71,11 @@ class DatadogProfilingService(BaseProfilingService):
         if not self.config.enabled:
             return
 
+        # 延迟导入 ddtrace，未开启 profiling 时不承担其加载开销
+        from ddtrace.profiling.profiler import Profiler
+
+        from .patch import patch_ddtrace_to_pyroscope
+
         patch_ddtrace_to_pyroscope(
             service_name=self.config.service_name,
             token=self.config.token,
@@ -24,6 +24,9 @@ otel_logger = logging.getLogger("otel")
 
 
 INTERVAL = 3
+QUERY_SPAN_NAME = "caller/query_hello_world"
+# 日志中仅记录响应体前若干字节，避免每次对完整响应做 unicode 解码
+RESPONSE_LOG_BYTES = 64
 
 
 @dataclass
@@ -39,6 +42,7 @@ class QuerierConfig:
 
 
 class QuerierService:
+    name = "querier"
 
     def __init__(self, config: Config):
         self.config = QuerierConfig(
@@ -49,7 +53,9 @@ class QuerierService:
         )
         self.tracer = trace.get_tracer(self.config.service_name)
         self.stopped = threading.Event()
-        
+        # 复用同一个 Session，保持 keep-alive 连接，避免每次请求重新建连
+        self.session = requests.Session()
+
         RequestsInstrumentor().instrument()
 
     def start(self):
@@ -61,7 +67,7 @@ class QuerierService:
         self.stopped.set()
 
     def _loop_query_hello_world(self):
-        logger.info("[%s] start loop_query_hello_world to periodically request %s", self, self.config.url)
+        logger.info("[%s] start loop_query_hello_world to periodically request %s", self.name, self.config.url)
 
         while not self.stopped.wait(INTERVAL):
             try:
@@ -69,13 +75,19 @@ class QuerierService:
             except Exception as e:
                 otel_logger.error("[query_hello_world] got error -> %s", e)
 
-        logger.info("[%s] loop_query_hello_world stopped", self)
+        # 在循环线程内关闭 Session，避免与进行中的请求并发关闭连接
+        self.session.close()
+        logger.info("[%s] loop_query_hello_world stopped", self.name)
 
     def _query_hello_world(self):
-        with self.tracer.start_as_current_span("caller/query_hello_world"):
-            otel_logger.info("[query_hello_world] send request")
-            response = requests.get(self.config.url)
-            otel_logger.info("[query_hello_world] received: %s", response.text)
+        with self.tracer.start_as_current_span(QUERY_SPAN_NAME):
+            if otel_logger.isEnabledFor(logging.INFO):
+                otel_logger.info("[query_hello_world] send request")
+            response = self.session.get(self.config.url, timeout=2)
+            if otel_logger.isEnabledFor(logging.INFO):
+                otel_logger.info(
+                    "[query_hello_world] received: %s", response.content[:RESPONSE_LOG_BYTES].decode("utf-8", "replace")
+                )
 
     def __str__(self):
-        return "querier"
+        return self.name
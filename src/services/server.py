@@ -9,12 +9,14 @@ Unless required by applicable law or agreed to in writing, software distributed
 an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the
 specific language governing permissions and limitations under the License.
 """
+import functools
 import logging
 import random
 import threading
 import time
+from contextlib import contextmanager
 from dataclasses import dataclass
-from typing import Iterable, Tuple
+from typing import Any, Callable, Dict, Iterable, Iterator, Tuple
 
 from flask import Flask, Request, request
 from opentelemetry import metrics, trace
@@ -24,10 +26,26 @@ from opentelemetry.sdk.trace import Span, Status, StatusCode
 
 from config import Config
 
+try:
+    from waitress import serve
+except ImportError:
+    serve = None
+
 logger = logging.getLogger(__name__)
 otel_logger = logging.getLogger("otel")
 logging.getLogger("werkzeug").disabled = True  # 关闭 werkzeug 日志输出
 
+# 请求处理路径上频繁调用，绑定为模块级名称以减少属性查找
+_get_current_span = trace.get_current_span
+_is_enabled_for = otel_logger.isEnabledFor
+_info = otel_logger.info
+_error = otel_logger.error
+
+# waitress 工作线程数
+SERVER_THREADS = 16
+# 不需要生成 Span 的低价值请求
+EXCLUDED_URLS = "healthz,metrics,favicon.ico"
+
 
 @dataclass
 class ServerConfig:
@@ -35,53 +53,126 @@ class ServerConfig:
     scheme: str
     address: str
     port: int
+    flat_spans: bool = False
+    cpu_bound_tasks: bool = False
+
+
+_COUNTRIES = (
+    "United States",
+    "Canada",
+    "United Kingdom",
+    "Germany",
+    "France",
+    "Japan",
+    "Australia",
+    "China",
+    "India",
+    "Brazil",
+)
+_ERROR_RATE = 0.1
+_CUSTOM_ERROR_MESSAGES = (
+    "mysql connect timeout",
+    "user not found",
+    "network unreachable",
+    "file not found",
+)
+
+# 国家列表固定，预先构造指标属性，避免每次上报时新建字典
+_ATTR_CACHE = {country: {"country": country} for country in _COUNTRIES}
+# 错误信息是固定的，预先构造对应的 Status，避免每次出错时重复创建
+_STATUS_CACHE = {message: Status(StatusCode.ERROR, message) for message in _CUSTOM_ERROR_MESSAGES}
 
 
 class APIException(Exception):
     status_code = 500
 
 
+@functools.lru_cache(maxsize=None)
+def _get_tracer(name: str) -> trace.Tracer:
+    return trace.get_tracer(name)
+
+
+@functools.lru_cache(maxsize=None)
+def _get_meter(name: str) -> metrics.Meter:
+    return metrics.get_meter(name)
+
+
+@contextmanager
+def _leaf_span(start_span: Callable[..., trace.Span], name: str) -> Iterator[trace.Span]:
+    """Start a span without making it current, only for spans that never have child spans"""
+    span = start_span(name)
+    try:
+        yield span
+    finally:
+        span.end()
+
+
 class HelloWorldHandler:
-    COUNTRIES = [
-        "United States",
-        "Canada",
-        "United Kingdom",
-        "Germany",
-        "France",
-        "Japan",
-        "Australia",
-        "China",
-        "India",
-        "Brazil",
-    ]
-    ERROR_RATE = 0.1
-    CUSTOM_ERROR_MESSAGES = [
-        "mysql connect timeout",
-        "user not found",
-        "network unreachable",
-        "file not found",
-    ]
-
-    def __init__(self, service_name: str):
-        self.tracer = trace.get_tracer(service_name)
-        self.meter = metrics.get_meter(service_name)
-
-        self.requests_total = self.meter.create_counter(
-            "requests_total",
-            description="Total number of HTTP requests",
-        )
-        self.task_execute_duration_seconds = self.meter.create_histogram(
-            "task_execute_duration_seconds",
-            unit="s",
-            description="Task execute duration in seconds",
-        )
-        # Metrics（指标）- 使用 Gauge 类型指标
-        self.meter.create_observable_gauge(
-            "memory_usage",
-            callbacks=[self.generate_random_usage],
-            unit="%",
-            description="Memory usage",
-        )
+    __slots__ = (
+        "tracer",
+        "meter",
+        "_random",
+        "_start_as_current_span",
+        "_start_span",
+        "requests_total",
+        "task_execute_duration_seconds",
+        "flat_spans",
+        "cpu_bound_tasks",
+    )
+
+    COUNTRIES = _COUNTRIES
+    ERROR_RATE = _ERROR_RATE
+    CUSTOM_ERROR_MESSAGES = _CUSTOM_ERROR_MESSAGES
+    CUSTOM_SPAN_ATTRIBUTES = {
+        "helloworld.kind": 1,
+        "helloworld.step": "traces_custom_span_demo",
+    }
+    SPAN_EVENT_ATTRIBUTES = {
+        "helloworld.kind": 2,
+        "helloworld.step": "traces_span_event_demo",
+    }
+
+    # 指标对象按 service_name 只创建一次，同一服务的多个 handler 实例共享
+    _instruments: Dict[str, Dict[str, Any]] = {}
+
+    def __init__(self, service_name: str, flat_spans: bool = False, cpu_bound_tasks: bool = False):
+        self.flat_spans = flat_spans
+        self.cpu_bound_tasks = cpu_bound_tasks
+        self.tracer = _get_tracer(service_name)
+        # 预先绑定 tracer 方法，减少每次创建 Span 时的属性查找
+        self._start_as_current_span = self.tracer.start_as_current_span
+        self._start_span = self.tracer.start_span
+        self.meter = _get_meter(service_name)
+        # 每个 handler 使用独立的随机数生成器，不与模块级共享实例互相影响
+        self._random = random.Random()
+
+        instruments = self._get_instruments(service_name, self.meter)
+        self.requests_total = instruments["requests_total"]
+        self.task_execute_duration_seconds = instruments["task_execute_duration_seconds"]
+
+    @classmethod
+    def _get_instruments(cls, service_name: str, meter: metrics.Meter) -> Dict[str, Any]:
+        instruments = cls._instruments.get(service_name)
+        if instruments is None:
+            instruments = cls._instruments[service_name] = {
+                "requests_total": meter.create_counter(
+                    "requests_total",
+                    description="Total number of HTTP requests",
+                ),
+                "task_execute_duration_seconds": meter.create_histogram(
+                    "task_execute_duration_seconds",
+                    unit="s",
+                    description="Task execute duration in seconds",
+                ),
+                # Metrics（指标）- 使用 Gauge 类型指标
+                "memory_usage": meter.create_observable_gauge(
+                    "memory_usage",
+                    callbacks=[cls.generate_random_usage],
+                    unit="%",
+                    description="Memory usage",
+                ),
+            }
+        return instruments
 
     @staticmethod
     def generate_random_usage(options: CallbackOptions) -> Iterable[Observation]:
@@ -89,95 +180,111 @@ class HelloWorldHandler:
         yield Observation(usage, {})
 
     def handle(self) -> str:
+        # 扁平模式下不创建 handle/hello_world，子 Span 直接挂在 Flask 入口 Span 下
+        if self.flat_spans:
+            return self._handle()
+
         # 不自动设置异常状态和记录异常，以展示手动设置方法 (traces_random_error_demo)
-        with self.tracer.start_as_current_span(
+        with self._start_as_current_span(
             "handle/hello_world", record_exception=False, set_status_on_exception=False
         ):
-            country = self.choice_country()
-            otel_logger.info("get country -> %s", country)
+            return self._handle()
+
+    def _handle(self) -> str:
+        country = self.choice_country()
+        if _is_enabled_for(logging.INFO):
+            _info("get country -> %s", country)
 
-            # Logs（日志）
-            self.logs_demo(request)
+        # Logs（日志）
+        self.logs_demo(request)
 
-            # Metrics（指标） - Counter 类型
-            self.metrics_counter_demo(country)
-            # Metrics（指标） - Histograms 类型
-            self.metrics_histogram_demo()
+        # Metrics（指标） - Counter 类型
+        self.metrics_counter_demo(country)
+        # Metrics（指标） - Histograms 类型
+        self.metrics_histogram_demo()
 
-            # Traces（调用链）- 自定义 Span
-            self.traces_custom_span_demo()
-            # Traces（调用链）- Span 事件
-            self.traces_span_event_demo()
-            # Traces（调用链）- 模拟错误
-            self.traces_random_error_demo()
+        # Traces（调用链）- 自定义 Span
+        self.traces_custom_span_demo()
+        # Traces（调用链）- Span 事件
+        self.traces_span_event_demo()
+        # Traces（调用链）- 模拟错误
+        self.traces_random_error_demo()
 
-            return self.generate_greeting(country)
+        return self.generate_greeting(country)
 
     # Logs（日志）打印日志
     @staticmethod
     def logs_demo(req: Request):
-        otel_logger.info("received request: %s %s", req.method, req.path)
+        if _is_enabled_for(logging.INFO):
+            _info("received request: %s %s", req.method, req.path)
 
     def choice_country(self) -> str:
-        return random.choice(self.COUNTRIES)
+        return self._random.choice(self.COUNTRIES)
 
     # Metrics（指标）- 使用 Counter 类型指标
     # Refer: https://opentelemetry.io/docs/languages/python/instrumentation/#creating-and-using-synchronous-instruments
     def metrics_counter_demo(self, country: str):
-        self.requests_total.add(1, {"country": country})
+        self.requests_total.add(1, _ATTR_CACHE[country])
 
     # Metrics（指标）- 使用 Histogram 类型指标
     def metrics_histogram_demo(self):
-        start_time = time.time()
-        self.do_something(100)
-        duration = time.time() - start_time
-        self.task_execute_duration_seconds.record(duration)
+        start_time = time.perf_counter()
+        self.do_something(100, cpu_bound=self.cpu_bound_tasks)
+        self.task_execute_duration_seconds.record(time.perf_counter() - start_time)
 
     # Traces（调用链）- 增加自定义 Span
     # Refer: https://opentelemetry.io/docs/languages/python/instrumentation/#creating-spans
     def traces_custom_span_demo(self):
-        with self.tracer.start_as_current_span("custom_span_demo/do_something") as span:
-            # 添加 Span 自定义属性
+        with _leaf_span(self._start_span, "custom_span_demo/do_something") as span:
+            # 添加 Span 自定义属性，未被采样（NonRecordingSpan）时跳过
             # Refer: https://opentelemetry.io/docs/languages/python/instrumentation/#add-attributes-to-a-span
-            # 也可以使用 span.set_attributes() 批量设置
-            span.set_attribute("helloworld.kind", 1)
-            span.set_attribute("helloworld.step", "traces_custom_span_demo")
+            # 也可以使用 span.set_attribute() 逐个设置
+            if span.is_recording():
+                span.set_attributes(self.CUSTOM_SPAN_ATTRIBUTES)
 
-            self.do_something(50)
+            self.do_something(50, cpu_bound=self.cpu_bound_tasks)
 
     # Traces（调用链）- Span 事件
     # Refer: https://opentelemetry.io/docs/languages/python/instrumentation/#adding-events
     def traces_span_event_demo(self):
-        with self.tracer.start_as_current_span("span_event_demo/do_something") as span:
-            attributes = {
-                "helloworld.kind": 2,
-                "helloworld.step": "traces_span_event_demo",
-            }
-            span.add_event("Before do_something", attributes)
-            self.do_something(50)
-            span.add_event("After do_something", attributes)
+        with _leaf_span(self._start_span, "span_event_demo/do_something") as span:
+            recording = span.is_recording()
+            if recording:
+                span.add_event("Before do_something", self.SPAN_EVENT_ATTRIBUTES)
+            self.do_something(50, cpu_bound=self.cpu_bound_tasks)
+            if recording:
+                span.add_event("After do_something", self.SPAN_EVENT_ATTRIBUTES)
 
     # Traces（调用链）- 异常事件、状态
     # Refer: https://opentelemetry.io/docs/languages/python/instrumentation/#record-exceptions-in-spans
     def traces_random_error_demo(self):
         try:
-            if random.random() < self.ERROR_RATE:
-                error_message = random.choice(self.CUSTOM_ERROR_MESSAGES)
+            if self._random.random() < self.ERROR_RATE:
+                error_message = self._random.choice(self.CUSTOM_ERROR_MESSAGES)
                 raise APIException(error_message)
         except APIException as e:
-            otel_logger.error("[traces_random_error_demo] got error -> %s", e)
-            current_span: Span = trace.get_current_span()
-            current_span.set_status(Status(StatusCode.ERROR, str(e)))
-            current_span.record_exception(e)
+            _error("[traces_random_error_demo] got error -> %s", e)
+            current_span: Span = _get_current_span()
+            # 未开启 traces 或未被采样时为 NonRecordingSpan，无需构造状态与异常事件
+            if current_span.is_recording():
+                error_message = str(e)
+                status = _STATUS_CACHE.get(error_message) or Status(StatusCode.ERROR, error_message)
+                current_span.set_status(status)
+                current_span.record_exception(e)
             raise
 
     @staticmethod
     def generate_greeting(country: str) -> str:
         return f"Hello World, {country}!"
 
-    @staticmethod
-    def do_something(max_ms: int):
-        duration = max(10, random.randint(0, max_ms)) / 1000
+    def do_something(self, max_ms: int, cpu_bound: bool = False):
+        duration = max(10, self._random.randint(0, max_ms)) / 1000
+        if not cpu_bound:
+            # 仅模拟耗时，sleep 期间释放 GIL，不占用 CPU
+            time.sleep(duration)
+            return
+
+        # 模拟 CPU 密集型任务，便于在 profiling 中观察
         i = 0
         start = time.time()
         while time.time() - start < duration:
@@ -185,6 +292,8 @@ class HelloWorldHandler:
 
 
 class HttpService:
+    name = "http"
+
     def __init__(self, config: Config):
         service_name = config.service_name
         self.config = ServerConfig(
@@ -192,29 +301,37 @@ class HttpService:
             scheme=config.http_scheme,
             address=config.http_address,
             port=config.http_port,
+            flat_spans=config.flat_spans,
+            cpu_bound_tasks=config.cpu_bound_tasks,
         )
         self.app = Flask(service_name)
-        FlaskInstrumentor().instrument_app(self.app)
+        FlaskInstrumentor().instrument_app(self.app, excluded_urls=EXCLUDED_URLS)
 
-        self.handler = HelloWorldHandler(service_name)
+        self.handler = HelloWorldHandler(
+            service_name, flat_spans=self.config.flat_spans, cpu_bound_tasks=self.config.cpu_bound_tasks
+        )
         self.app.add_url_rule("/helloworld", view_func=self.handler.handle)
         self.app.register_error_handler(APIException, self._error_handler)
 
     def start(self):
         server_thread = threading.Thread(target=self._run_server, daemon=True)
         server_thread.start()
-        logger.info("[%s] start to listen http server at %s:%s", self, self.config.address, self.config.port)
+        logger.info("[%s] start to listen http server at %s:%s", self.name, self.config.address, self.config.port)
 
     @staticmethod
     def _error_handler(e: APIException) -> Tuple[str, int]:
         return str(e), e.status_code
 
     def _run_server(self):
-        self.app.run(host=self.config.address, port=self.config.port)
+        if serve is not None:
+            serve(self.app, host=self.config.address, port=self.config.port, threads=SERVER_THREADS)
+        else:
+            # 未安装 waitress 时退回 Flask 开发服务器，并确保以多线程方式处理请求
+            self.app.run(host=self.config.address, port=self.config.port, threaded=True)
 
     @staticmethod
     def stop():
         pass
 
     def __str__(self):
-        return "http"
+        return self.name